@@ -0,0 +1,327 @@
+"""
+一键构建数据集：ELAN 标注转换 -> 视频切分 -> 标注合并
+
+依次执行 convert_annotations.py、split_videos.py、merge_annos.py 的逻辑，每个阶段的输出
+以输入内容和参数的哈希为键缓存在 <dataset_root>/.build_cache 下。只有标注或源视频发生变化的
+录像才会重新转换和切分，不同录像之间并发处理。切分出的每个片段单独缓存，帧范围和编码参数不变的片段
+不会重新编码；所有录像的 FFmpeg 共用一个大小为 --max_workers 的线程池。
+
+    python build_dataset.py --raw_anno_dir data/b11_phone_motion2_backview/elan \\
+        --dataset_root data/b11_phone_motion2_backview --clip_secs 180 240 --overlap_secs 30
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import random
+import threading
+from pathlib import Path
+
+from convert_annotations import parse_elan_txt
+from merge_annos import merge_annotations
+from split_videos import DEFAULT_ENCODER_ARGS, plan_clips, process_video_clip
+
+
+def hash_inputs(*parts):
+    """对阶段的输入和参数计算哈希，parts 需要能被 JSON 序列化"""
+    content = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class StageCache:
+    """按内容哈希缓存每个阶段的结果，键不变且输出文件都存在时直接复用"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.lock = threading.Lock()
+        self.digest_file = self.cache_dir / "file_digests.json"
+        if self.digest_file.exists():
+            with open(self.digest_file, "r") as f:
+                self.file_digests = json.load(f)
+        else:
+            self.file_digests = {}
+
+    def file_digest(self, path):
+        """
+        计算文件内容的 sha256
+
+        视频文件很大，摘要按 (大小, 修改时间) 缓存，文件没有被改动时不会重新读取。
+        """
+        path = Path(path)
+        stat = path.stat()
+        with self.lock:
+            cached = self.file_digests.get(str(path))
+        if cached is not None and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 24), b""):
+                sha256.update(chunk)
+        with self.lock:
+            self.file_digests[str(path)] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": sha256.hexdigest(),
+            }
+        return sha256.hexdigest()
+
+    def save_file_digests(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self.lock:
+            with open(self.digest_file, "w") as f:
+                json.dump(self.file_digests, f, indent=2)
+
+    def _stamp_path(self, stage, name):
+        return self.cache_dir / stage / f"{name}.json"
+
+    def load(self, stage, name):
+        """读取上一次的缓存记录，不存在时返回 None"""
+        stamp_path = self._stamp_path(stage, name)
+        if not stamp_path.exists():
+            return None
+        with open(stamp_path, "r") as f:
+            return json.load(f)
+
+    def get(self, stage, name, key):
+        """键匹配且记录的输出文件都存在时返回缓存的结果，否则返回 None"""
+        stamp = self.load(stage, name)
+        if stamp is None or stamp["key"] != key:
+            return None
+        if not all(Path(output).exists() for output in stamp["outputs"]):
+            return None
+        return stamp["result"]
+
+    def put(self, stage, name, key, result, outputs=()):
+        stamp_path = self._stamp_path(stage, name)
+        os.makedirs(stamp_path.parent, exist_ok=True)
+        with open(stamp_path, "w") as f:
+            json.dump({"key": key, "result": result, "outputs": [str(output) for output in outputs]}, f, ensure_ascii=False)
+
+    def names(self, stage):
+        """该阶段已缓存的所有条目名"""
+        return [stamp_path.stem for stamp_path in (self.cache_dir / stage).glob("*.json")]
+
+    def remove(self, stage, name):
+        self._stamp_path(stage, name).unlink(missing_ok=True)
+
+
+def remove_outputs(outputs, keep=()):
+    """删除上一次构建留下、本次不再需要的输出文件，返回这些输出"""
+    keep = set(str(output) for output in keep)
+    stale = [output for output in outputs if output not in keep]
+    for output in stale:
+        if Path(output).exists():
+            os.remove(output)
+    return stale
+
+
+def forget_clips(cache, outputs):
+    """删除已经不存在的 mp4 片段的缓存记录"""
+    for output in outputs:
+        if output.endswith(".mp4"):
+            cache.remove("clip", Path(output).stem)
+
+
+def encode_clips(cache, video_path, video_digest, fps, clips, args, encoder):
+    """
+    把片段提交到所有录像共享的编码线程池，返回全部片段的 mp4 路径
+
+    每个片段以 (源视频, 帧范围, 编码参数) 为键单独缓存，只修改标签时帧范围不变，片段不会被重新编码。
+    任一片段失败时删除失败的输出并抛出 RuntimeError，成功的片段照常记录，下次构建可以复用。
+    """
+    outputs = []
+    futures = {}
+    for clip_name, start_frame, end_frame, clip_annotation in clips:
+        output_path = Path(args.clip_dir) / f"{clip_name}.mp4"
+        outputs.append(output_path)
+        clip_key = hash_inputs("clip", video_digest, start_frame, end_frame, args.encoder_args)
+        if cache.get("clip", clip_name, clip_key) is not None:
+            continue
+        # 先删掉旧记录，编码中途被打断时残缺的文件不会被当成有效输出
+        cache.remove("clip", clip_name)
+        print(f"[encode] {clip_name}")
+        future = encoder.submit(
+            process_video_clip,
+            video_path,
+            start_frame,
+            end_frame,
+            fps,
+            output_path,
+            clip_annotation,
+            args.encoder_args,
+        )
+        futures[future] = (clip_name, clip_key, [start_frame, end_frame], output_path)
+
+    failed = []
+    for future in concurrent.futures.as_completed(futures):
+        clip_name, clip_key, frame_range, output_path = futures[future]
+        try:
+            success = future.result()["success"]
+        except Exception as e:
+            print(f"[error] {clip_name}: {e}")
+            success = False
+        if success:
+            cache.put("clip", clip_name, clip_key, frame_range, [output_path])
+        else:
+            failed.append(clip_name)
+            if output_path.exists():
+                os.remove(output_path)
+    if failed:
+        raise RuntimeError(f"Failed to extract {len(failed)}/{len(futures)} clips from {video_path}")
+    return outputs
+
+
+def build_video(cache, anno_file, args, encoder):
+    """
+    对单个录像依次执行转换和切分阶段，返回 (录像名, 数据库条目, 切分阶段的键)
+
+    encoder 是所有录像共享的编码线程池，FFmpeg 的总并发数由它的大小决定。
+    """
+    name = anno_file.stem
+    video_path = anno_file.parent.parent / "raw_data" / "video" / f"{name}.mp4"
+    video_digest = cache.file_digest(video_path)
+
+    # 阶段一：ELAN txt -> 数据库条目
+    convert_key = hash_inputs("convert", cache.file_digest(anno_file), video_digest, args.test_split_ratio, args.seed)
+    entry = cache.get("convert", name, convert_key)
+    if entry is None:
+        print(f"[convert] {name}")
+        entry = parse_elan_txt(anno_file, args.test_split_ratio, rng=random.Random(f"{args.seed}:convert:{name}"))
+        cache.put("convert", name, convert_key, entry)
+
+    # 阶段二：按标注切分视频，只依赖该录像的标注和源视频
+    clip_secs = args.clip_secs[0] if len(args.clip_secs) == 1 else args.clip_secs
+    split_key = hash_inputs(
+        "split",
+        entry["annotations"],
+        video_digest,
+        clip_secs,
+        args.overlap_secs,
+        args.train_val_ratio,
+        args.seed,
+        args.virtual,
+        None if args.virtual else args.encoder_args,
+        str(args.clip_dir),
+    )
+    if cache.get("split", name, split_key) is None:
+        print(f"[split] {name}")
+        previous = cache.load("split", name)
+        fps, clips = plan_clips(
+            str(video_path),
+            entry["annotations"],
+            clip_secs,
+            overlap_secs=args.overlap_secs,
+            train_val_ratio=args.train_val_ratio,
+            virtual=args.virtual,
+            rng=random.Random(f"{args.seed}:split:{name}"),
+        )
+        # 与 split_video 一致，只保留有标注的片段
+        clips = [clip for clip in clips if clip[3]["annotations"]]
+        os.makedirs(args.clip_dir, exist_ok=True)
+        outputs = [Path(args.clip_dir) / f"annotations_{name}.json"]
+        if not args.virtual:
+            outputs += encode_clips(cache, str(video_path), video_digest, fps, clips, args, encoder)
+
+        database = {clip_name: clip_annotation for clip_name, _, _, clip_annotation in clips}
+        with open(outputs[0], "w") as f:
+            json.dump({"database": database}, f)
+        if previous is not None:
+            forget_clips(cache, remove_outputs(previous["outputs"], keep=outputs))
+        cache.put("split", name, split_key, sorted(database), outputs)
+
+    return name, entry, split_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description='一键构建数据集：标注转换、视频切分、标注合并')
+    parser.add_argument('--raw_anno_dir', type=str, required=True,
+                        help='ELAN 导出的 txt 标注目录，视频位于 ../raw_data/video')
+    parser.add_argument('--dataset_root', type=str, default="data/b11_phone_motion2_backview",
+                        help='数据集根目录')
+    parser.add_argument('--clip_dir', type=str, default=None,
+                        help='切分后片段和片段标注的目录，默认 <dataset_root>/raw_data/clips2')
+    parser.add_argument('--anno_file', type=str, default=None,
+                        help='转换后的完整标注文件，默认 <dataset_root>/annotations/b11_phone_backview_anno.json')
+    parser.add_argument('--output_file', type=str, default=None,
+                        help='合并后的片段标注文件，默认 <dataset_root>/annotations/merged_annotations.json')
+    parser.add_argument('--clip_secs', type=int, nargs='+', default=[180, 240],
+                        help='片段长度（秒），给两个值时在区间内随机')
+    parser.add_argument('--overlap_secs', type=int, default=30, help='相邻片段的重叠时长（秒）')
+    parser.add_argument('--test_split_ratio', type=float, default=0.3, help='录像划分为测试集的比例')
+    parser.add_argument('--train_val_ratio', type=float, default=0.5, help='片段划分为测试集的比例')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，决定片段长度和数据集划分')
+    parser.add_argument('--virtual', action='store_true', help='只生成帧范围标注，不切出 mp4 文件')
+    parser.add_argument('--encoder', type=str, default=DEFAULT_ENCODER_ARGS[1], help='FFmpeg 视频编码器')
+    parser.add_argument('--preset', type=str, default=DEFAULT_ENCODER_ARGS[3], help='编码速度和质量的权衡')
+    parser.add_argument('--crf', type=int, default=int(DEFAULT_ENCODER_ARGS[5]), help='质量设置，低值=高质量')
+    parser.add_argument('--jobs', type=int, default=4, help='同时处理的录像数')
+    parser.add_argument('--max_workers', type=int, default=4, help='所有录像共享的 FFmpeg 并发数')
+    args = parser.parse_args()
+
+    dataset_root = Path(args.dataset_root)
+    args.clip_dir = args.clip_dir or str(dataset_root / "raw_data" / "clips2")
+    args.anno_file = args.anno_file or str(dataset_root / "annotations" / "b11_phone_backview_anno.json")
+    args.output_file = args.output_file or str(dataset_root / "annotations" / "merged_annotations.json")
+    args.encoder_args = ['-c:v', args.encoder, '-preset', args.preset, '-crf', str(args.crf)]
+
+    cache = StageCache(dataset_root / ".build_cache")
+    anno_files = sorted(path for path in Path(args.raw_anno_dir).glob("*.txt") if path.stem != "category_idx")
+
+    # 删除已经不存在的录像留下的片段和标注，避免被合并进来
+    current_names = set(anno_file.stem for anno_file in anno_files)
+    for name in cache.names("split"):
+        if name not in current_names:
+            print(f"[clean] {name}")
+            forget_clips(cache, remove_outputs(cache.load("split", name)["outputs"]))
+            cache.remove("split", name)
+
+    database = {}
+    split_keys = {}
+    failures = []
+    try:
+        # 录像之间并发规划和转换，编码统一提交到一个线程池，避免同时启动 jobs * max_workers 个 FFmpeg
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.max_workers) as encoder, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            futures = {
+                executor.submit(build_video, cache, anno_file, args, encoder): anno_file for anno_file in anno_files
+            }
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    name, entry, split_key = future.result()
+                except Exception as e:
+                    # 失败的录像不写缓存，下次构建会重新处理；其他录像继续完成
+                    print(f"[error] {futures[future].stem}: {e}")
+                    failures.append(futures[future].stem)
+                    continue
+                database[name] = entry
+                split_keys[name] = split_key
+    finally:
+        cache.save_file_digests()
+
+    if failures:
+        raise RuntimeError(f"Dataset build failed for {len(failures)} videos: {', '.join(sorted(failures))}")
+
+    database = dict(sorted(database.items()))
+    os.makedirs(os.path.dirname(args.anno_file), exist_ok=True)
+    with open(args.anno_file, "w") as f:
+        json.dump({"database": database}, f)
+
+    # 类别排序后写出，保证同样的标注得到同样的类别编号
+    categories = sorted(set(segment["label"] for video in database.values() for segment in video["annotations"]))
+    with open(os.path.join(os.path.dirname(args.anno_file), "category_idx.txt"), "w") as f:
+        for category in categories:
+            f.write(f"{category}\n")
+
+    # 阶段三：合并所有录像的片段标注
+    merge_key = hash_inputs("merge", split_keys)
+    if cache.get("merge", "merged", merge_key) is None:
+        print("[merge]")
+        merge_annotations(args.clip_dir, args.output_file)
+        cache.put("merge", "merged", merge_key, None, [args.output_file])
+    print(f"Dataset build finished: {len(database)} videos, annotations at {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+长视频的两阶段（粗到细）推理
+
+第一遍用较大的 sample_stride（或更小的模型，例如 VideoMAE-S 配置）对整段视频做滑窗推理，
+得分高于 candidate_thresh 的检测结果向两侧扩展 margin_secs 后作为候选区域。
+第二遍只在与候选区域重叠的窗口上运行全帧率模型，中心落在候选区域内的检测用第二遍的结果，其余保留第一遍的结果。
+
+加上 --dense 时会再跑一遍全帧率的密集推理作为基线，报告耗时加速比和 mAP 差异。每个模型在计时前先推理
+--warmup_windows 个窗口预热（cuDNN 选算法、CUDA 上下文），密集基线最先运行，视频的页缓存只会对两阶段推理不利。
+
+    python coarse_to_fine_inference.py configs/.../e2e_phonebackview_videomae_b_768x1_224_adapter.py \\
+        exps/.../epoch_599.pth --coarse_stride 4 --candidate_thresh 0.1 --margin_secs 5 --dense
+"""
+import argparse
+import json
+import os
+import time
+
+import torch
+import torch.distributed as dist
+from mmengine.config import Config
+from torch.nn.parallel import DistributedDataParallel
+
+from opentad.cores.test_engine import eval_one_epoch
+from opentad.datasets.builder import build_dataset
+from opentad.evaluations import build_evaluator
+from opentad.models import build_detector
+from opentad.utils.logger import setup_logger
+
+from shared_memory_loader import build_dataloader
+
+
+def load_model(cfg, ckpt_path, logger):
+    model = build_detector(cfg.model)
+    model.to(0)
+    model = DistributedDataParallel(model, device_ids=[0], output_device=0)
+
+    checkpoint = torch.load(ckpt_path, map_location="cuda:0")
+
+    use_ema = getattr(cfg.solver, "ema", False)
+    if use_ema:
+        model.load_state_dict(checkpoint["state_dict_ema"])
+        logger.info("Using Model EMA...")
+    else:
+        model.load_state_dict(checkpoint["state_dict"])
+    return model
+
+
+def window_range(data_item):
+    """
+    滑窗数据集中一个窗口覆盖的时间范围（秒）
+
+    ThumosSlidingDataset 的 data_list 条目为 [video_name, video_info, video_anno, window_snippet_centers]，
+    window_snippet_centers 是窗口内各 snippet 的帧号。
+    """
+    video_info, window_snippet_centers = data_item[1], data_item[3]
+    secs_per_frame = video_info["duration"] / video_info["frame"]
+    return window_snippet_centers[0] * secs_per_frame, window_snippet_centers[-1] * secs_per_frame
+
+
+def overlaps(segment, regions):
+    return any(segment[0] <= end and segment[1] >= start for start, end in regions)
+
+
+def in_regions(segment, regions):
+    """检测结果的中心是否落在某个候选区域内"""
+    center = (segment[0] + segment[1]) / 2
+    return any(start <= center <= end for start, end in regions)
+
+
+def run_inference(model, cfg, logger, result_path, regions=None, max_windows=None):
+    """
+    在测试集上推理并把检测结果保存到 result_path
+
+    regions 不为 None 时只保留与候选区域重叠的窗口，max_windows 不为 None 时只推理前 max_windows 个窗口。
+    返回 (检测结果, 耗时秒数, 推理的窗口数)。
+    """
+    use_amp = getattr(cfg.solver, "amp", False)
+    # eval_one_epoch 只有在 save_dict=True 时才写 result_detection.json，先删掉上一遍留下的文件
+    cfg.post_processing.save_dict = True
+    result_detection_path = os.path.join(cfg.work_dir, "result_detection.json")
+    if os.path.exists(result_detection_path):
+        os.remove(result_detection_path)
+
+    test_dataset = build_dataset(cfg.dataset.test, default_args=dict(logger=logger))
+    if regions is not None:
+        num_windows = len(test_dataset.data_list)
+        test_dataset.data_list = [
+            item for item in test_dataset.data_list if overlaps(window_range(item), regions.get(item[0], []))
+        ]
+        logger.info(f"Keeping {len(test_dataset.data_list)}/{num_windows} windows that overlap candidate regions")
+    if max_windows is not None:
+        test_dataset.data_list = test_dataset.data_list[:max_windows]
+    num_windows = len(test_dataset.data_list)
+
+    results = {}
+    start_time = time.perf_counter()
+    if num_windows > 0:
+        test_loader = build_dataloader(
+            test_dataset,
+            rank=0,
+            world_size=1,
+            shuffle=False,
+            drop_last=False,
+            **cfg.solver.test,
+        )
+        eval_one_epoch(
+            test_loader,
+            model,
+            cfg,
+            logger,
+            0,
+            model_ema=None,  # since we have loaded the ema model above
+            use_amp=use_amp,
+            world_size=1,
+            not_eval=True,
+        )
+        with open(result_detection_path, "r") as f:
+            results = json.load(f)["results"]
+    torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start_time
+
+    with open(result_path, "w") as f:
+        json.dump({"results": results}, f)
+    return results, elapsed, num_windows
+
+
+def warm_up(model, cfg, logger, num_windows):
+    """不计时地推理前 num_windows 个窗口，避免第一遍的计时包含 cuDNN 选算法等一次性开销"""
+    if num_windows <= 0:
+        return
+    logger.info(f"Warming up on {num_windows} windows...")
+    run_inference(model, cfg, logger, os.path.join(cfg.work_dir, "result_detection_warmup.json"), max_windows=num_windows)
+
+
+def find_candidate_regions(results, score_thresh, margin_secs):
+    """把得分高于阈值的粗检测结果向两侧扩展 margin_secs，合并重叠部分后作为候选区域"""
+    regions = {}
+    for video_name, detections in results.items():
+        intervals = sorted(
+            [max(0.0, det["segment"][0] - margin_secs), det["segment"][1] + margin_secs]
+            for det in detections
+            if det["score"] >= score_thresh
+        )
+        merged = []
+        for start, end in intervals:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        regions[video_name] = merged
+    return regions
+
+
+def merge_detections(coarse_results, fine_results, regions, max_seg_num=None):
+    """
+    按检测结果的中心划分时间轴：候选区域内只用细检测结果，区域外只用粗检测结果
+
+    细推理的窗口会超出候选区域，区域外的细检测结果和粗检测结果会重复报告同一个动作，因此丢弃。
+    """
+    merged = {}
+    for video_name in set(coarse_results) | set(fine_results):
+        video_regions = regions.get(video_name, [])
+        detections = [det for det in fine_results.get(video_name, []) if in_regions(det["segment"], video_regions)]
+        detections += [det for det in coarse_results.get(video_name, []) if not in_regions(det["segment"], video_regions)]
+        merged[video_name] = sorted(detections, key=lambda det: det["score"], reverse=True)[:max_seg_num]
+    return merged
+
+
+def evaluate(cfg, result_path, logger):
+    evaluator = build_evaluator(dict(prediction_filename=result_path, **cfg.evaluation))
+    metrics_dict = evaluator.evaluate()
+    evaluator.logging(logger)
+    return metrics_dict
+
+
+def main():
+    parser = argparse.ArgumentParser(description='粗到细的两阶段长视频推理')
+    parser.add_argument('config', type=str, help='全帧率模型的配置文件')
+    parser.add_argument('checkpoint', type=str, help='全帧率模型的权重')
+    parser.add_argument('--coarse_config', type=str, default=None,
+                        help='第一遍使用的配置文件，默认与 config 相同')
+    parser.add_argument('--coarse_checkpoint', type=str, default=None,
+                        help='第一遍使用的权重，默认与 checkpoint 相同')
+    parser.add_argument('--coarse_stride', type=int, default=4, help='第一遍的 sample_stride')
+    parser.add_argument('--candidate_thresh', type=float, default=0.1,
+                        help='候选区域的得分阈值，越低召回越高、加速越少')
+    parser.add_argument('--margin_secs', type=float, default=5.0, help='候选区域向两侧扩展的时长（秒）')
+    parser.add_argument('--dense', action='store_true', help='同时运行全帧率密集推理，报告加速比和 mAP 差异')
+    parser.add_argument('--warmup_windows', type=int, default=8, help='每个模型计时前预热推理的窗口数')
+    args = parser.parse_args()
+
+    os.environ.setdefault('MASTER_ADDR', 'localhost')
+    os.environ.setdefault('MASTER_PORT', '0')
+    dist.init_process_group("nccl", init_method="env://", rank=0, world_size=1)
+    torch.cuda.set_device(0)
+
+    cfg = Config.fromfile(args.config)
+    coarse_cfg = Config.fromfile(args.coarse_config or args.config)
+    coarse_cfg.dataset.test.sample_stride = args.coarse_stride
+    coarse_cfg.work_dir = cfg.work_dir
+    os.makedirs(cfg.work_dir, exist_ok=True)
+    logger = setup_logger("CoarseToFine", save_dir=cfg.work_dir, distributed_rank=0)
+
+    model = load_model(cfg, args.checkpoint, logger)
+    warm_up(model, cfg, logger, args.warmup_windows)
+
+    # 密集基线最先运行：之后的两阶段推理读到的视频可能已在页缓存中，报告的加速比只会偏低
+    if args.dense:
+        logger.info("Dense baseline pass...")
+        dense_path = os.path.join(cfg.work_dir, "result_detection_dense.json")
+        _, dense_time, dense_windows = run_inference(model, cfg, logger, dense_path)
+
+    # 第一遍：粗采样，找候选区域。没有指定单独的粗模型时复用全帧率模型
+    logger.info(f"Coarse pass with sample_stride={args.coarse_stride}...")
+    separate_coarse_model = args.coarse_config is not None or args.coarse_checkpoint is not None
+    if separate_coarse_model:
+        coarse_model = load_model(coarse_cfg, args.coarse_checkpoint or args.checkpoint, logger)
+    else:
+        coarse_model = model
+    # 粗采样的输入形状不同，同一个模型也需要重新预热
+    warm_up(coarse_model, coarse_cfg, logger, args.warmup_windows)
+    coarse_path = os.path.join(cfg.work_dir, "result_detection_coarse.json")
+    coarse_results, coarse_time, coarse_windows = run_inference(coarse_model, coarse_cfg, logger, coarse_path)
+    del coarse_model
+    if separate_coarse_model:
+        torch.cuda.empty_cache()
+
+    regions = find_candidate_regions(coarse_results, args.candidate_thresh, args.margin_secs)
+    num_regions = sum(len(video_regions) for video_regions in regions.values())
+    logger.info(f"Found {num_regions} candidate regions in {len(regions)} videos")
+
+    # 第二遍：全帧率模型只跑与候选区域重叠的窗口
+    logger.info("Fine pass on candidate windows...")
+    fine_path = os.path.join(cfg.work_dir, "result_detection_fine.json")
+    fine_results, fine_time, fine_windows = run_inference(model, cfg, logger, fine_path, regions=regions)
+
+    max_seg_num = cfg.post_processing.nms.get("max_seg_num", None)
+    merged_results = merge_detections(coarse_results, fine_results, regions, max_seg_num=max_seg_num)
+    merged_path = os.path.join(cfg.work_dir, "result_detection_coarse_to_fine.json")
+    with open(merged_path, "w") as f:
+        json.dump({"results": merged_results}, f)
+    logger.info(
+        f"Coarse-to-fine inference: coarse {coarse_time:.1f}s ({coarse_windows} windows), "
+        f"fine {fine_time:.1f}s ({fine_windows} windows), total {coarse_time + fine_time:.1f}s"
+    )
+    metrics = evaluate(cfg, merged_path, logger)
+
+    if args.dense:
+        dense_metrics = evaluate(cfg, dense_path, logger)
+        logger.info(
+            f"Dense baseline: {dense_time:.1f}s ({dense_windows} windows), "
+            f"speedup {dense_time / (coarse_time + fine_time):.2f}x, "
+            f"average mAP {metrics['average_mAP']:.4f} vs dense {dense_metrics['average_mAP']:.4f} "
+            f"(delta {metrics['average_mAP'] - dense_metrics['average_mAP']:+.4f})"
+        )
+
+
+if __name__ == "__main__":
+    main()
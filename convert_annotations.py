@@ -6,7 +6,7 @@ from datetime import datetime
 from mmcv import VideoReader
 import random
 
-def parse_elan_txt(path: Path, test_split_ratio = 0.3):
+def parse_elan_txt(path: Path, test_split_ratio = 0.3, rng = random):
     with open(path, "r") as f:
         lines = f.readlines()
     
@@ -37,7 +37,7 @@ def parse_elan_txt(path: Path, test_split_ratio = 0.3):
     return {
         "duration": reader.frame_cnt / reader.fps,
         "frame": reader.frame_cnt,
-        "subset": "training" if random.random() > test_split_ratio else "testing",
+        "subset": "training" if rng.random() > test_split_ratio else "testing",
         "annotations": segments
     }
 
@@ -114,7 +114,8 @@ model = dict(
 )
 
 solver = dict(
-    train=dict(batch_size=1, num_workers=1),
+    # shared_memory 需要通过 shared_memory_loader.py 启动，见该文件说明
+    train=dict(batch_size=1, num_workers=4, shared_memory=True),
     val=dict(batch_size=1, num_workers=1),
     test=dict(batch_size=1, num_workers=1),
     clip_grad_norm=1,
@@ -0,0 +1,313 @@
+"""
+window_size / batch_size 的显存和计算量规划
+
+读取 mmengine 配置，根据模型和 pipeline 的定义估算：
+    - backbone 和 ActionFormer 检测头的参数、梯度、优化器状态的显存，backbone 激活的显存
+    - 送入模型的输入 batch（uint8 和归一化后的 fp32 各一份）的显存
+    - 每个样本解码后的帧缓冲大小
+    - 每个窗口 backbone 的 FLOPs
+并在给定显存预算下推荐可行的最大 window_size 和 batch_size。检测头的激活没有计入，
+它作用在 window_size 长的特征序列上，比 backbone 的激活小两个数量级以上，由 --reserve_gb 覆盖。
+
+安装了 OpenTAD 时，会在 CPU 上用小分辨率构建 backbone，实测激活（反向需要保存的张量）和 FLOPs，
+按 token 数拟合 a*n + b*n^2 后外推到目标尺寸，替代纯公式估算。实测失败时退回公式估算。
+
+    python plan_memory.py e2e_phonebackview_videomae_b_768x1_224_adapter.py --memory_budget_gb 24
+"""
+import argparse
+import copy
+
+from mmengine.config import Config
+
+GB = 1024**3
+
+# mmaction VisionTransformer 默认的时间维 patch 大小
+TUBE_SIZE = 2
+
+
+def get_input_size(pipeline):
+    """从 pipeline 中找出送入模型的空间尺寸，取最后一个固定尺寸的 Resize 或 CenterCrop"""
+    input_size = None
+    for transform in pipeline:
+        transform_type = transform["type"].split(".")[-1]
+        if transform_type == "Resize" and not transform.get("keep_ratio", True) and min(transform["scale"]) > 0:
+            input_size = tuple(transform["scale"])
+        elif transform_type == "CenterCrop":
+            crop_size = transform["crop_size"]
+            input_size = (crop_size, crop_size) if isinstance(crop_size, int) else tuple(crop_size)
+    assert input_size is not None, "Cannot find a fixed-size Resize or CenterCrop in the pipeline"
+    return input_size
+
+
+def num_tokens(backbone_cfg, input_size):
+    """一个 chunk（num_frames 帧）对应的 token 数"""
+    patch_size = backbone_cfg["patch_size"]
+    return (backbone_cfg["num_frames"] // TUBE_SIZE) * (input_size[0] // patch_size) * (input_size[1] // patch_size)
+
+
+def head_num_params(model_cfg):
+    """
+    按公式估算 ActionFormer 的 projection、neck 和 rpn_head 的参数量
+
+    配置中没有写出的字段使用 OpenTAD actionformer.py 基础配置的默认值，忽略偏置和 LayerNorm 以外的小项。
+    """
+    projection = model_cfg.get("projection", {})
+    neck = model_cfg.get("neck", {})
+    rpn_head = model_cfg.get("rpn_head", {})
+
+    # Conv1DTransformerProj：arch[0] 层 kernel=3 的嵌入卷积，arch[1] + arch[2] 个 transformer 块
+    in_channels = projection.get("in_channels", 2048)
+    dims = projection.get("out_channels", 512)
+    arch = projection.get("arch", (2, 2, 5))
+    num_params = 3 * in_channels * dims + (arch[0] - 1) * 3 * dims**2
+    # 每个块 QKV 和输出投影 4*d^2，MLP 8*d^2
+    num_params += (arch[1] + arch[2]) * 12 * dims**2
+
+    # FPNIdentity 每个层级一个 LayerNorm
+    num_params += neck.get("num_levels", 6) * 2 * neck.get("out_channels", dims)
+
+    # ActionFormerHead：分类和回归分支各 num_convs 层 kernel=3 的卷积，再接输出卷积
+    head_in = rpn_head.get("in_channels", dims)
+    feat = rpn_head.get("feat_channels", 512)
+    num_convs = rpn_head.get("num_convs", 2)
+    branch = 3 * head_in * feat + (num_convs - 1) * 3 * feat**2
+    num_params += 2 * branch + 3 * feat * (rpn_head.get("num_classes", 20) + 2)
+    return num_params
+
+
+def fit_quadratic(points):
+    """用两个 (n, y) 点拟合 y = a*n + b*n^2"""
+    (n1, y1), (n2, y2) = points
+    b = (y2 / n2 - y1 / n1) / (n2 - n1)
+    a = y1 / n1 - b * n1
+    return lambda n: a * n + b * n**2
+
+
+def measure_activation_bytes(model, inputs):
+    """
+    统计一次前向中为反向保存的张量字节数
+
+    Linear、LayerNorm 等层会把权重也保存下来，权重是与输入尺寸无关的常量，会让按 token 数的拟合失真，因此排除。
+    """
+    import torch
+
+    param_storages = set(param.untyped_storage().data_ptr() for param in model.parameters())
+    storages = {}
+
+    def pack(tensor):
+        storage = tensor.untyped_storage()
+        if storage.data_ptr() not in param_storages:
+            storages[storage.data_ptr()] = storage.nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        model(inputs)
+    return sum(storages.values())
+
+
+class AnalyticProfile:
+    """按 ViT 结构的公式估算单个 chunk 的参数量、激活和 FLOPs（未计入 adapter）"""
+
+    def __init__(self, backbone_cfg):
+        self.dims = backbone_cfg["embed_dims"]
+        self.depth = backbone_cfg["depth"]
+        self.num_heads = backbone_cfg["num_heads"]
+        self.mlp_ratio = backbone_cfg.get("mlp_ratio", 4)
+        self.patch_numel = 3 * TUBE_SIZE * backbone_cfg["patch_size"] ** 2
+        self.num_params = self.depth * (4 + 2 * self.mlp_ratio) * self.dims**2 + self.patch_numel * self.dims
+        self.num_trainable_params = None
+
+    def activation_bytes(self, n):
+        # 参考 Megatron 的激活估算：每层每个 token 约 17*d 个元素，注意力矩阵约 2.5*h*n 个元素，按 fp32 计
+        return 4 * self.depth * (17 * n * self.dims + 2.5 * self.num_heads * n**2)
+
+    def flops(self, n):
+        # 每层 QKV/投影/MLP 共 (8 + 4*mlp_ratio)*n*d^2 次乘加，注意力 2*n^2*d 次乘加
+        macs = self.depth * ((4 + 2 * self.mlp_ratio) * n * self.dims**2 + 2 * n**2 * self.dims)
+        return 2 * (macs + n * self.patch_numel * self.dims)
+
+
+class CalibratedProfile:
+    """在 CPU 上用小分辨率实测 backbone 的激活和 FLOPs，再按 token 数外推"""
+
+    def __init__(self, backbone_cfg, input_size, calib_sizes=(64, 96)):
+        import torch
+        from torch.utils.flop_counter import FlopCounterMode
+        from mmaction.registry import MODELS
+
+        import opentad.models  # noqa: F401, register VisionTransformerAdapter
+
+        self.dims = backbone_cfg["embed_dims"]
+        self.depth = backbone_cfg["depth"]
+
+        # 参数量与输入帧数无关，用目标分辨率构建一次
+        model = MODELS.build(self._small_cfg(backbone_cfg, input_size[0]))
+        self.num_params = sum(p.numel() for p in model.parameters())
+        self.num_trainable_params = sum(p.numel() for name, p in model.named_parameters() if "adapter" in name)
+        del model
+
+        activation_points, flop_points = [], []
+        for size in calib_sizes:
+            model = MODELS.build(self._small_cfg(backbone_cfg, size))
+            inputs = torch.randn(1, 3, backbone_cfg["num_frames"], size, size)
+            n = num_tokens(backbone_cfg, (size, size))
+            activation_points.append((n, measure_activation_bytes(model, inputs)))
+
+            with torch.no_grad(), FlopCounterMode(display=False) as flop_counter:
+                model(inputs)
+            flop_points.append((n, flop_counter.get_total_flops()))
+            del model
+
+        self.activation_bytes = fit_quadratic(activation_points)
+        self.flops = fit_quadratic(flop_points)
+
+    @staticmethod
+    def _small_cfg(backbone_cfg, size):
+        small_cfg = copy.deepcopy(dict(backbone_cfg))
+        small_cfg.update(
+            img_size=size,
+            total_frames=backbone_cfg["num_frames"],  # 只构建一个 chunk
+            with_cp=False,  # 关闭 checkpoint 才能统计完整的激活
+            drop_path_rate=0.0,
+        )
+        return small_cfg
+
+
+class MemoryPlanner:
+    """根据配置和单 chunk 的 profile 估算不同 window_size / batch_size 下的显存"""
+
+    def __init__(self, cfg, profile, source_resolution=(1920, 1080), reserve_gb=1.0):
+        self.cfg = cfg
+        self.profile = profile
+        self.backbone_cfg = cfg.model.backbone.backbone
+        self.scale_factor = cfg.get("scale_factor", 1)
+        self.input_size = get_input_size(cfg.dataset.train.pipeline)
+        self.tokens = num_tokens(self.backbone_cfg, self.input_size)
+        self.source_resolution = source_resolution
+        self.reserve_bytes = reserve_gb * GB
+
+        self.num_head_params = head_num_params(cfg.model)
+
+        self.amp = cfg.solver.get("amp", False)
+        self.with_cp = self.backbone_cfg.get("with_cp", False)
+        self.ema = cfg.solver.get("ema", False)
+        # backbone 学习率为 0 且被 exclude 时只训练 adapter
+        backbone_optim = cfg.get("optimizer", {}).get("backbone", {})
+        self.adapter_only = backbone_optim.get("lr", None) == 0 and "backbone" in backbone_optim.get("exclude", [])
+
+    def num_chunks(self, window_size):
+        return window_size * self.scale_factor // self.backbone_cfg["num_frames"]
+
+    def param_bytes(self):
+        """backbone 和检测头的 fp32 参数、梯度和 AdamW 状态，检测头始终参与训练"""
+        num_params = self.profile.num_params + self.num_head_params
+        if self.adapter_only and self.profile.num_trainable_params is not None:
+            num_trainable = self.profile.num_trainable_params + self.num_head_params
+        else:
+            num_trainable = num_params
+        # fp32 参数 + 梯度 + AdamW 两个状态，EMA 再存一份参数
+        return 4 * num_params * (2 if self.ema else 1) + 4 * num_trainable + 8 * num_trainable
+
+    def activation_bytes(self, window_size, batch_size):
+        chunk_bytes = self.profile.activation_bytes(self.tokens)
+        if self.with_cp:
+            # checkpoint 只保存每层的输入，反向时重算一层
+            chunk_bytes = 4 * self.profile.depth * self.tokens * self.profile.dims + chunk_bytes / self.profile.depth
+        if self.amp:
+            chunk_bytes /= 2
+        return batch_size * self.num_chunks(window_size) * chunk_bytes
+
+    def input_bytes(self, window_size, batch_size):
+        """GPU 上的输入 batch：拷贝上来的 uint8 帧和 data_preprocessor 归一化后的 fp32 帧"""
+        numel = window_size * self.scale_factor * 3 * self.input_size[0] * self.input_size[1]
+        return batch_size * numel * (1 + 4)
+
+    def frame_buffer_bytes(self, window_size):
+        """单个样本解码（源分辨率）和 resize 后的 uint8 帧缓冲"""
+        num_frames = window_size * self.scale_factor
+        decoded = num_frames * 3 * self.source_resolution[0] * self.source_resolution[1]
+        resized = num_frames * 3 * self.input_size[0] * self.input_size[1]
+        return decoded, resized
+
+    def backbone_flops(self, window_size):
+        return self.num_chunks(window_size) * self.profile.flops(self.tokens)
+
+    def gpu_bytes(self, window_size, batch_size):
+        return (
+            self.param_bytes()
+            + self.activation_bytes(window_size, batch_size)
+            + self.input_bytes(window_size, batch_size)
+            + self.reserve_bytes
+        )
+
+    def recommend(self, window_sizes, memory_budget_gb, max_batch_size=16):
+        """返回 (window_size, batch_size)：优先最大的 window_size，再取该窗口下最大的 batch_size"""
+        budget = memory_budget_gb * GB
+        for window_size in sorted(window_sizes, reverse=True):
+            for batch_size in range(max_batch_size, 0, -1):
+                if self.gpu_bytes(window_size, batch_size) <= budget:
+                    return window_size, batch_size
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='估算显存和计算量，推荐 window_size 和 batch_size')
+    parser.add_argument('config', type=str, help='mmengine 配置文件')
+    parser.add_argument('--memory_budget_gb', type=float, default=24, help='单卡显存预算（GB）')
+    parser.add_argument('--window_sizes', type=int, nargs='+', default=[256, 512, 768, 1024, 1536],
+                        help='候选 window_size')
+    parser.add_argument('--max_batch_size', type=int, default=16, help='候选 batch_size 的上限')
+    parser.add_argument('--source_resolution', type=int, nargs=2, default=[1920, 1080],
+                        help='源视频分辨率（宽 高），用于估算解码缓冲')
+    parser.add_argument('--reserve_gb', type=float, default=1.0, help='CUDA 上下文和显存碎片的预留（GB）')
+    parser.add_argument('--no_calibrate', action='store_true', help='跳过 CPU 实测，只用公式估算')
+    args = parser.parse_args()
+
+    cfg = Config.fromfile(args.config)
+    backbone_cfg = cfg.model.backbone.backbone
+    input_size = get_input_size(cfg.dataset.train.pipeline)
+
+    profile = None
+    if not args.no_calibrate:
+        try:
+            profile = CalibratedProfile(backbone_cfg, input_size)
+            print("Calibrated with CPU measurements")
+        except ImportError as e:
+            print(f"Calibration unavailable ({e}), falling back to analytic estimates")
+        except Exception as e:
+            # 构建或前向失败（例如配置里的 backbone 参数与当前 OpenTAD 版本不兼容）时不中断规划
+            print(f"Calibration failed ({type(e).__name__}: {e}), falling back to analytic estimates")
+    if profile is None:
+        profile = AnalyticProfile(backbone_cfg)
+
+    planner = MemoryPlanner(cfg, profile, tuple(args.source_resolution), args.reserve_gb)
+    window_sizes = [w for w in args.window_sizes if w * planner.scale_factor % backbone_cfg["num_frames"] == 0]
+
+    print(f"Input {input_size[0]}x{input_size[1]}, {planner.tokens} tokens per chunk, "
+          f"amp={planner.amp}, with_cp={planner.with_cp}, ema={planner.ema}, adapter_only={planner.adapter_only}")
+    print(f"Parameters: backbone {profile.num_params / 1e6:.1f}M + head {planner.num_head_params / 1e6:.1f}M, "
+          f"parameter/optimizer memory {planner.param_bytes() / GB:.2f} GB")
+    print(f"{'window':>8} {'GFLOPs':>10} {'decoded GB':>11} {'resized GB':>11} {'input GB/sample':>16} "
+          f"{'act GB/sample':>14} {'max batch':>10}")
+    for window_size in window_sizes:
+        decoded, resized = planner.frame_buffer_bytes(window_size)
+        max_batch = planner.recommend([window_size], args.memory_budget_gb, args.max_batch_size)
+        print(
+            f"{window_size:>8} {planner.backbone_flops(window_size) / 1e9:>10.1f} {decoded / GB:>11.2f} "
+            f"{resized / GB:>11.2f} {planner.input_bytes(window_size, 1) / GB:>16.2f} "
+            f"{planner.activation_bytes(window_size, 1) / GB:>14.2f} {max_batch[1] if max_batch else 0:>10}"
+        )
+    print("GPU memory = parameters/optimizer + input batch + backbone activations + reserve; "
+          "head activations are not included")
+
+    recommendation = planner.recommend(window_sizes, args.memory_budget_gb, args.max_batch_size)
+    if recommendation is None:
+        print(f"No feasible window_size within {args.memory_budget_gb} GB")
+    else:
+        window_size, batch_size = recommendation
+        print(f"Recommended: window_size={window_size}, batch_size={batch_size} "
+              f"(~{planner.gpu_bytes(window_size, batch_size) / GB:.2f} GB of {args.memory_budget_gb} GB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+共享内存零拷贝的 DataLoader
+
+一个 768 帧的样本（768x3x224x224 uint8）超过 100MB。默认的 DataLoader 每一步都要在 worker 中
+新建一块共享内存、把 batch 拷进去，主进程再做一次 pin_memory 拷贝，所以配置里只能用 num_workers=1。
+
+这里在创建 worker 之前预先分配一个共享内存缓冲池（num_buffers 个 batch 槽位）：
+worker 的 collate 直接把 inputs 写入空闲槽位，主进程拿到的 inputs 只是这个槽位的视图，
+传输时只传递共享内存句柄，不拷贝数据。主进程请求下一个 batch 时，上一个 batch 的槽位被归还。
+
+用法：在 solver 中打开 shared_memory，并通过本模块启动 OpenTAD 的训练/测试脚本，
+启动时会把 opentad.datasets.build_dataloader 换成本模块的实现：
+
+    solver = dict(train=dict(batch_size=4, num_workers=4, shared_memory=True), ...)
+
+    python shared_memory_loader.py tools/train.py configs/.../e2e_phonebackview_videomae_s_768x1_160_adapter.py
+
+注意 inputs 的视图只在当前 step 内有效，跨 step 保留时需要 clone()。
+"""
+import os
+import runpy
+import sys
+
+import torch
+import torch.multiprocessing as mp
+from torch.utils.data import DataLoader, DistributedSampler
+
+from opentad.datasets.builder import build_dataloader as _build_dataloader
+from opentad.datasets.builder import collate
+
+
+class SharedMemoryPool:
+    """预先分配在共享内存中的 batch 缓冲池，空闲槽位编号通过进程间队列传递"""
+
+    def __init__(self, num_buffers, batch_shape, dtype, mp_context=mp):
+        self.num_buffers = num_buffers
+        self.buffers = torch.empty((num_buffers, *batch_shape), dtype=dtype).share_memory_()
+        self.slot_numel = self.buffers[0].numel()
+        self.mp_context = mp_context
+        self.reset()
+
+    def reset(self):
+        """
+        换一个装满全部槽位的空闲队列，在每轮迭代创建 worker 之前调用
+
+        上一轮被中断时，阻塞在 acquire 中的 worker 会在持有队列读锁时被终止，旧队列不能再用。
+        """
+        self.free_slots = self.mp_context.Queue()
+        for slot in range(self.num_buffers):
+            self.free_slots.put(slot)
+
+    def acquire(self):
+        """取一个空闲槽位，没有时阻塞等待主进程归还"""
+        return self.free_slots.get()
+
+    def release(self, inputs):
+        """根据 inputs 视图在缓冲池中的偏移归还槽位"""
+        self.free_slots.put(inputs.storage_offset() // self.slot_numel)
+
+
+class SharedMemoryCollate:
+    """在 OpenTAD collate 的基础上，把 inputs 直接写入缓冲池的槽位"""
+
+    def __init__(self, pool, key="inputs"):
+        self.pool = pool
+        self.key = key
+
+    def __call__(self, batch):
+        inputs = [sample.pop(self.key) for sample in batch]
+        collate_data = collate(batch)
+
+        slot = self.pool.acquire()
+        buffer = self.pool.buffers[slot, : len(inputs)]
+        for i, sample_inputs in enumerate(inputs):
+            sample_inputs = torch.as_tensor(sample_inputs)
+            if sample_inputs.shape != buffer.shape[1:]:
+                self.pool.free_slots.put(slot)
+                raise ValueError(
+                    f"Sample {self.key} shape {tuple(sample_inputs.shape)} does not match "
+                    f"shared memory buffer shape {tuple(buffer.shape[1:])}"
+                )
+            buffer[i].copy_(sample_inputs)
+        collate_data[self.key] = buffer
+        return collate_data
+
+
+class SharedMemoryDataLoader:
+    """包装 DataLoader，在请求下一个 batch 前归还上一个 batch 的槽位"""
+
+    def __init__(self, dataloader, pool, key="inputs"):
+        self.dataloader = dataloader
+        self.pool = pool
+        self.key = key
+
+    def __getattr__(self, name):
+        # sampler.set_epoch / dataset 等属性直接转发给内部的 DataLoader
+        return getattr(self.dataloader, name)
+
+    def __len__(self):
+        return len(self.dataloader)
+
+    def __iter__(self):
+        # 上一轮提前中断时，预取中的 batch 会占着槽位，这里统一回收。
+        # 非 persistent_workers 时上一轮的 worker 已经退出，不会再有槽位在使用中
+        self.pool.reset()
+        iterator = iter(self.dataloader)
+        last_inputs = None
+        try:
+            while True:
+                if last_inputs is not None:
+                    self.pool.release(last_inputs)
+                    last_inputs = None
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    return
+                last_inputs = batch[self.key]
+                yield batch
+        finally:
+            del iterator
+
+
+def build_dataloader(
+    dataset,
+    batch_size,
+    rank,
+    world_size,
+    shuffle=False,
+    drop_last=False,
+    shared_memory=False,
+    num_buffers=None,
+    input_shape=None,
+    input_dtype=torch.uint8,
+    **kwargs,
+):
+    """
+    与 OpenTAD 的 build_dataloader 参数一致，shared_memory=True 时使用共享内存缓冲池
+
+    Args:
+        shared_memory (bool): 是否启用共享内存零拷贝模式
+        num_buffers (int): 缓冲池槽位数，默认 num_workers * prefetch_factor + 1
+        input_shape (tuple): 单个样本 inputs 的形状，默认读取 dataset[0] 得到
+        input_dtype (torch.dtype): 指定 input_shape 时 inputs 的类型
+    """
+    if not shared_memory:
+        return _build_dataloader(
+            dataset, batch_size, rank, world_size, shuffle=shuffle, drop_last=drop_last, **kwargs
+        )
+
+    # 每轮迭代开始时会重置缓冲池，persistent_workers 下上一轮中断时预取的 batch 仍占着槽位，重置后会被重复分配
+    assert not kwargs.get("persistent_workers", False), "persistent_workers is not supported in shared memory mode"
+
+    num_workers = kwargs.get("num_workers", 0)
+    prefetch_factor = kwargs.get("prefetch_factor") or 2
+    min_buffers = max(num_workers, 1) * prefetch_factor + 1
+    if num_buffers is None:
+        num_buffers = min_buffers
+    assert num_buffers >= min_buffers, f"num_buffers should be at least {min_buffers} to avoid blocking workers"
+
+    if input_shape is None:
+        sample_inputs = torch.as_tensor(dataset[0]["inputs"])
+        input_shape, input_dtype = tuple(sample_inputs.shape), sample_inputs.dtype
+
+    mp_context = kwargs.get("multiprocessing_context") or mp
+    if isinstance(mp_context, str):
+        mp_context = mp.get_context(mp_context)
+    pool = SharedMemoryPool(num_buffers, (batch_size, *input_shape), input_dtype, mp_context=mp_context)
+
+    # pin_memory 会把 batch 再拷贝一次到锁页内存，和零拷贝的目的相反
+    kwargs.pop("pin_memory", None)
+    sampler = DistributedSampler(dataset, num_replicas=world_size, rank=rank, shuffle=shuffle, drop_last=drop_last)
+    dataloader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        sampler=sampler,
+        collate_fn=SharedMemoryCollate(pool),
+        pin_memory=False,
+        **kwargs,
+    )
+    return SharedMemoryDataLoader(dataloader, pool)
+
+
+def install():
+    """把 opentad.datasets.build_dataloader 换成本模块的实现，需在导入 OpenTAD 的训练/测试脚本之前调用"""
+    import opentad.datasets
+
+    opentad.datasets.build_dataloader = build_dataloader
+
+
+if __name__ == "__main__":
+    # python shared_memory_loader.py <script> [args...]：替换 build_dataloader 后运行 OpenTAD 脚本
+    import shared_memory_loader
+
+    shared_memory_loader.install()
+    sys.argv = sys.argv[1:]
+    # 与直接运行脚本一致，把脚本所在目录放到 sys.path 最前面
+    sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+    runpy.run_path(sys.argv[0], run_name="__main__")
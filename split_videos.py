@@ -1,3 +1,4 @@
+import argparse
 import json
 import os
 import subprocess
@@ -23,7 +24,11 @@ def prune_start_end(start_frame, end_frame, fps, annotations):
     return start_frame, end_frame
 
 
-def extract_clip_with_ffmpeg(video_path, output_path, start_time, duration):
+# 默认编码参数：视频编码、编码速度和质量的权衡、质量设置（低值=高质量）
+DEFAULT_ENCODER_ARGS = ['-c:v', 'h264_nvenc', '-preset', 'slow', '-crf', '18']
+
+
+def extract_clip_with_ffmpeg(video_path, output_path, start_time, duration, encoder_args=None):
     """使用FFmpeg提取视频片段"""
     cmd = [
         'ffmpeg',
@@ -31,9 +36,7 @@ def extract_clip_with_ffmpeg(video_path, output_path, start_time, duration):
         '-ss', str(start_time),  # 起始时间
         '-i', str(video_path),  # 输入文件
         '-t', str(duration),  # 持续时间
-        '-c:v', 'h264_nvenc',  # 视频编码
-        '-preset', 'slow',  # 编码速度和质量的权衡
-        '-crf', '18',  # 质量设置，低值=高质量
+        *(encoder_args or DEFAULT_ENCODER_ARGS),
         str(output_path)
     ]
     process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -101,12 +104,12 @@ class TaskExecutor:
         return self.results
 
 
-def process_video_clip(video_path, start_frame, end_frame, fps, output_path, clip_annotation):
+def process_video_clip(video_path, start_frame, end_frame, fps, output_path, clip_annotation, encoder_args=None):
     """处理单个视频片段的函数，用于线程池执行"""
     start_time = start_frame / fps
     duration = (end_frame - start_frame) / fps
     print(f"Processing clip from {start_time:.2f}s to {start_time + duration:.2f}s")
-    success = extract_clip_with_ffmpeg(video_path, output_path, start_time, duration)
+    success = extract_clip_with_ffmpeg(video_path, output_path, start_time, duration, encoder_args)
     return {
         "output_path": str(output_path), 
         "success": success, 
@@ -114,47 +117,48 @@ def process_video_clip(video_path, start_frame, end_frame, fps, output_path, cli
     }
 
 
-def split_video(video_path: str, annotations: list, clip_secs: Union[int, Tuple[int, int]], 
-               output_dir, overlap_secs: int = 0, train_val_ratio: float = 0.2,
-               max_workers: int = 4):
+def plan_clips(video_path: str, annotations: list, clip_secs: Union[int, Tuple[int, int]],
+               overlap_secs: int = 0, train_val_ratio: float = 0.2, virtual: bool = False,
+               rng: random.Random = None):
+    """
+    计算片段的帧范围和片段标注，不做编码
+
+    Returns:
+        fps, [(片段名, 起始帧, 结束帧, 片段标注)]，包括没有标注的片段
+    """
+    rng = rng or random
     video = VideoReader(video_path)
     try:
         video_stem = Path(video_path).stem
         fps = video.get_avg_fps()
         
         frame_index = 0
-        splitted_annotations = {
-            "database": {}
-        }
-        
-        # 创建任务执行器
-        executor = TaskExecutor(max_workers=max_workers)
-        
         min_clip_sec = clip_secs if isinstance(clip_secs, int) else clip_secs[0]
-        clip_tasks = []
+        clips = []
         
         while frame_index <= (len(video) - math.floor(min_clip_sec * video.get_avg_fps())):
             start_frame = frame_index
             if isinstance(clip_secs, int):
                 end_frame = min(frame_index + math.ceil(clip_secs * video.get_avg_fps()), len(video))
             else:
-                clip_len = random.randint(clip_secs[0], clip_secs[1])
+                clip_len = rng.randint(clip_secs[0], clip_secs[1])
                 end_frame = min(start_frame + math.ceil(clip_len * video.get_avg_fps()), len(video))
 
             start_frame, end_frame = prune_start_end(start_frame, end_frame, fps, annotations)
             
             output_name = f"clip_{video_stem}_{start_frame}_{end_frame}"
-            output_path = Path(output_dir) / f"{output_name}.mp4"
-            
-            # 创建输出目录（如果不存在）
-            os.makedirs(Path(output_dir), exist_ok=True)
 
             clip_annotation = {
                 "duration": (end_frame - start_frame) / fps,
                 "frame": end_frame - start_frame,
-                "subset": "training" if random.random() > train_val_ratio else "testing",
+                "subset": "training" if rng.random() > train_val_ratio else "testing",
                 "annotations": []
             }
+            if virtual:
+                # 存绝对路径，训练时的工作目录可以与切分时不同
+                clip_annotation["source_video"] = str(Path(video_path).resolve())
+                clip_annotation["start_frame"] = start_frame
+                clip_annotation["end_frame"] = end_frame
             
             for anno in annotations:
                 # 检查注释是否在当前片段范围内
@@ -166,46 +170,95 @@ def split_video(video_path: str, annotations: list, clip_secs: Union[int, Tuple[
                 clip_anno["segment"] = [anno_start, anno_end]
                 clip_annotation["annotations"].append(clip_anno)
 
-            # 添加到任务执行器
-            executor.add_task(
-                process_video_clip, 
-                video_path, 
-                start_frame, 
-                end_frame, 
-                fps, 
-                output_path, 
-                clip_annotation
-            )
-            
-            clip_tasks.append((output_name, clip_annotation))
+            clips.append((output_name, start_frame, end_frame, clip_annotation))
             
             frame_index = end_frame - math.floor(overlap_secs * video.get_avg_fps())
-            print(f"Queued task for {output_name}, from frame {start_frame} to {end_frame}")
             
             if end_frame >= len(video):
                 break
         
-        # 等待所有任务完成
-        results = executor.wait_completion()
-        
-        # 处理结果和构建注释
-        for output_name, clip_annotation in clip_tasks:
-            if clip_annotation["annotations"]:  # 只添加有注释的片段
-                splitted_annotations["database"][output_name] = clip_annotation
-        
-        # 写入注释到JSON文件
-        with open(Path(output_dir) / f"annotations_{video_stem}.json", "w") as f:
-            json.dump(splitted_annotations, f)
-            
-        print(f"Completed processing video {video_path}")
-        return splitted_annotations
+        return fps, clips
         
     finally:
         # 确保视频读取器被释放
         del video
 
 
+def split_video(video_path: str, annotations: list, clip_secs: Union[int, Tuple[int, int]], 
+               output_dir, overlap_secs: int = 0, train_val_ratio: float = 0.2,
+               max_workers: int = 4, virtual: bool = False, rng: random.Random = None,
+               encoder_args: list = None):
+    """
+    将长视频切分为带重叠的片段，并生成对应的片段标注
+
+    virtual=True 时不调用 FFmpeg 切出 mp4，而是在片段标注中记录源视频和帧范围
+    （source_video / start_frame / end_frame），由 virtual_clips.py 在加载时直接从源视频解码。
+    rng 用于片段长度和训练/测试划分，传入固定种子的 random.Random 可以得到可复现的切分结果。
+    没有标注的片段不会被编码；任何片段编码失败时删除失败的输出并抛出 RuntimeError，不写标注文件。
+    """
+    video_stem = Path(video_path).stem
+    fps, clips = plan_clips(video_path, annotations, clip_secs, overlap_secs=overlap_secs,
+                            train_val_ratio=train_val_ratio, virtual=virtual, rng=rng)
+    
+    # 创建输出目录（如果不存在）
+    os.makedirs(Path(output_dir), exist_ok=True)
+    
+    splitted_annotations = {
+        "database": {}
+    }
+    
+    # 创建任务执行器
+    executor = TaskExecutor(max_workers=max_workers)
+    queued_outputs = []
+    
+    for output_name, start_frame, end_frame, clip_annotation in clips:
+        # 添加到任务执行器，虚拟片段和没有标注的片段不需要编码
+        if not virtual and clip_annotation["annotations"]:
+            output_path = Path(output_dir) / f"{output_name}.mp4"
+            executor.add_task(
+                process_video_clip, 
+                video_path, 
+                start_frame, 
+                end_frame, 
+                fps, 
+                output_path, 
+                clip_annotation,
+                encoder_args
+            )
+            queued_outputs.append(output_path)
+            print(f"Queued task for {output_name}, from frame {start_frame} to {end_frame}")
+    
+    # 等待所有任务完成
+    results = executor.wait_completion()
+    
+    # TaskExecutor 会吞掉异常，按成功的结果反查失败的片段
+    succeeded = set(result["output_path"] for result in results if result["success"])
+    failed = [output_path for output_path in queued_outputs if str(output_path) not in succeeded]
+    if failed:
+        for output_path in failed:
+            if output_path.exists():
+                os.remove(output_path)
+        raise RuntimeError(f"Failed to extract {len(failed)}/{len(queued_outputs)} clips from {video_path}")
+    
+    # 处理结果和构建注释
+    for output_name, _, _, clip_annotation in clips:
+        if clip_annotation["annotations"]:  # 只添加有注释的片段
+            splitted_annotations["database"][output_name] = clip_annotation
+    
+    # 写入注释到JSON文件
+    with open(Path(output_dir) / f"annotations_{video_stem}.json", "w") as f:
+        json.dump(splitted_annotations, f)
+        
+    print(f"Completed processing video {video_path}")
+    return splitted_annotations
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='将视频切分为带重叠的片段')
+    parser.add_argument('--virtual', action='store_true',
+                        help='只生成帧范围标注，不切出 mp4 文件')
+    args = parser.parse_args()
+
     with open("/mnt/data/dtong/pubrepos/OpenTAD/data/b11_phone_motion2_backview/annotations/b11_phone_backview_anno.json", "r") as f:
         database = json.load(f)["database"]
     
@@ -223,6 +276,7 @@ if __name__ == "__main__":
             overlap_secs=30,
             train_val_ratio=0.5,
             max_workers=max_workers,
+            virtual=args.virtual,
         )
 
 
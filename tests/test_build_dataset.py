@@ -0,0 +1,229 @@
+import importlib
+import json
+import sys
+import types
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+FPS = 10
+
+
+class FakeBuild:
+    """记录各阶段的调用，标签和片段帧范围由测试修改"""
+
+    def __init__(self):
+        self.labels = {}
+        self.ranges = {}
+        self.failing = set()
+        self.converted = []
+        self.planned = []
+        self.encoded = []
+
+    def parse_elan_txt(self, path, test_split_ratio=0.3, rng=None):
+        self.converted.append(path.stem)
+        return dict(
+            subset="training",
+            annotations=[dict(segment=[1.0, 2.0], label=self.labels[path.stem])],
+        )
+
+    def plan_clips(self, video_path, annotations, clip_secs, overlap_secs=0, train_val_ratio=0.2,
+                   virtual=False, rng=None):
+        stem = Path(video_path).stem
+        self.planned.append(stem)
+        clips = []
+        for start_frame, end_frame in self.ranges[stem]:
+            clip_annotation = dict(subset="training", annotations=[dict(anno) for anno in annotations])
+            clips.append((f"clip_{stem}_{start_frame}_{end_frame}", start_frame, end_frame, clip_annotation))
+        # 没有标注的片段不会被编码
+        clips.append((f"clip_{stem}_empty", 0, 1, dict(subset="training", annotations=[])))
+        return FPS, clips
+
+    def process_video_clip(self, video_path, start_frame, end_frame, fps, output_path, clip_annotation,
+                           encoder_args=None):
+        self.encoded.append(Path(output_path).stem)
+        Path(output_path).write_bytes(b"partial")
+        success = Path(output_path).stem not in self.failing
+        return {"output_path": str(output_path), "success": success, "clip_annotation": clip_annotation}
+
+
+@pytest.fixture
+def build_dataset(monkeypatch):
+    # mmcv / decord 只用于读取视频，由 parse_elan_txt / plan_clips 的替身代替
+    for name in ["mmcv", "decord"]:
+        module = types.ModuleType(name)
+        module.VideoReader = None
+        monkeypatch.setitem(sys.modules, name, module)
+    for name in ["build_dataset", "convert_annotations", "split_videos"]:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    module = importlib.import_module("build_dataset")
+    fake = FakeBuild()
+    monkeypatch.setattr(module, "parse_elan_txt", fake.parse_elan_txt)
+    monkeypatch.setattr(module, "plan_clips", fake.plan_clips)
+    monkeypatch.setattr(module, "process_video_clip", fake.process_video_clip)
+    yield module, fake
+    for name in ["build_dataset", "convert_annotations", "split_videos"]:
+        sys.modules.pop(name, None)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / "elan").mkdir()
+    (tmp_path / "raw_data" / "video").mkdir(parents=True)
+    return tmp_path
+
+
+def add_recording(tree, fake, name, label="phone", ranges=((0, 100), (80, 200))):
+    (tree / "elan" / f"{name}.txt").write_text(label)
+    (tree / "raw_data" / "video" / f"{name}.mp4").write_bytes(name.encode())
+    fake.labels[name] = label
+    fake.ranges[name] = list(ranges)
+    return tree / "elan" / f"{name}.txt"
+
+
+def make_args(tree):
+    return types.SimpleNamespace(
+        clip_dir=str(tree / "clips"),
+        clip_secs=[180, 240],
+        overlap_secs=30,
+        test_split_ratio=0.3,
+        train_val_ratio=0.5,
+        seed=0,
+        virtual=False,
+        encoder_args=["-c:v", "libx264", "-preset", "fast", "-crf", "18"],
+    )
+
+
+def build(module, tree, anno_file, args=None):
+    cache = module.StageCache(tree / ".build_cache")
+    with ThreadPoolExecutor(max_workers=2) as encoder:
+        return module.build_video(cache, anno_file, args or make_args(tree), encoder), cache
+
+
+def test_stage_cache_key_and_outputs(build_dataset, tmp_path):
+    module, _ = build_dataset
+    cache = module.StageCache(tmp_path / "cache")
+    output = tmp_path / "output.json"
+    output.write_text("{}")
+    key = module.hash_inputs("stage", [1, 2], {"a": 1})
+
+    assert cache.get("stage", "video", key) is None
+    cache.put("stage", "video", key, {"clips": 2}, [output])
+    assert cache.get("stage", "video", key) == {"clips": 2}
+    assert cache.get("stage", "video", module.hash_inputs("stage", [1, 3], {"a": 1})) is None
+
+    output.unlink()
+    assert cache.get("stage", "video", key) is None
+
+
+def test_unchanged_recording_is_reused(build_dataset, tree):
+    module, fake = build_dataset
+    anno_file = add_recording(tree, fake, "a")
+    (name, entry, split_key), _ = build(module, tree, anno_file)
+    assert sorted(fake.encoded) == ["clip_a_0_100", "clip_a_80_200"]
+
+    fake.converted.clear()
+    fake.planned.clear()
+    fake.encoded.clear()
+    assert build(module, tree, anno_file)[0] == (name, entry, split_key)
+    assert fake.converted == fake.planned == fake.encoded == []
+
+    with open(tree / "clips" / "annotations_a.json") as f:
+        assert sorted(json.load(f)["database"]) == ["clip_a_0_100", "clip_a_80_200"]
+    assert not (tree / "clips" / "clip_a_empty.mp4").exists()
+
+
+def test_label_change_keeps_encoded_clips(build_dataset, tree):
+    module, fake = build_dataset
+    anno_file = add_recording(tree, fake, "a")
+    build(module, tree, anno_file)
+
+    fake.encoded.clear()
+    add_recording(tree, fake, "a", label="call")
+    build(module, tree, anno_file)
+    assert fake.planned == ["a", "a"]
+    assert fake.encoded == []
+
+    with open(tree / "clips" / "annotations_a.json") as f:
+        database = json.load(f)["database"]
+    assert [clip["annotations"][0]["label"] for clip in database.values()] == ["call", "call"]
+
+
+def test_changed_range_reencodes_only_that_clip(build_dataset, tree):
+    module, fake = build_dataset
+    anno_file = add_recording(tree, fake, "a")
+    build(module, tree, anno_file)
+
+    fake.encoded.clear()
+    add_recording(tree, fake, "a", label="call", ranges=[(0, 100), (90, 200)])
+    _, cache = build(module, tree, anno_file)
+    assert fake.encoded == ["clip_a_90_200"]
+    assert not (tree / "clips" / "clip_a_80_200.mp4").exists()
+    assert cache.load("clip", "clip_a_80_200") is None
+
+
+def test_encoder_change_reencodes_clips(build_dataset, tree):
+    module, fake = build_dataset
+    anno_file = add_recording(tree, fake, "a")
+    build(module, tree, anno_file)
+
+    fake.encoded.clear()
+    args = make_args(tree)
+    args.encoder_args = ["-c:v", "libx264", "-preset", "slow", "-crf", "18"]
+    build(module, tree, anno_file, args)
+    assert sorted(fake.encoded) == ["clip_a_0_100", "clip_a_80_200"]
+
+
+def test_failed_clip_is_not_stamped(build_dataset, tree):
+    module, fake = build_dataset
+    anno_file = add_recording(tree, fake, "a")
+    fake.failing.add("clip_a_80_200")
+
+    cache = module.StageCache(tree / ".build_cache")
+    with ThreadPoolExecutor(max_workers=2) as encoder:
+        with pytest.raises(RuntimeError):
+            module.build_video(cache, anno_file, make_args(tree), encoder)
+    assert cache.load("split", "a") is None
+    assert cache.load("clip", "clip_a_80_200") is None
+    assert not (tree / "clips" / "clip_a_80_200.mp4").exists()
+    assert not (tree / "clips" / "annotations_a.json").exists()
+
+    # 下次构建只重新编码失败的片段
+    fake.failing.clear()
+    fake.encoded.clear()
+    build(module, tree, anno_file)
+    assert fake.encoded == ["clip_a_80_200"]
+
+
+def test_main_cleans_removed_recording(build_dataset, tree, monkeypatch):
+    module, fake = build_dataset
+    add_recording(tree, fake, "a")
+    anno_file_b = add_recording(tree, fake, "b", label="call")
+    argv = [
+        "build_dataset.py",
+        "--raw_anno_dir", str(tree / "elan"),
+        "--dataset_root", str(tree),
+        "--jobs", "2",
+        "--max_workers", "2",
+    ]
+    monkeypatch.setattr(sys, "argv", argv)
+    module.main()
+    with open(tree / "annotations" / "merged_annotations.json") as f:
+        assert len(json.load(f)["database"]) == 4
+
+    anno_file_b.unlink()
+    module.main()
+    clip_dir = tree / "raw_data" / "clips2"
+    assert sorted(path.name for path in clip_dir.iterdir()) == [
+        "annotations_a.json",
+        "clip_a_0_100.mp4",
+        "clip_a_80_200.mp4",
+    ]
+    cache = module.StageCache(tree / ".build_cache")
+    assert cache.names("split") == ["a"]
+    assert sorted(cache.names("clip")) == ["clip_a_0_100", "clip_a_80_200"]
+    with open(tree / "annotations" / "merged_annotations.json") as f:
+        assert sorted(json.load(f)["database"]) == ["clip_a_0_100", "clip_a_80_200"]
+    with open(tree / "annotations" / "category_idx.txt") as f:
+        assert f.read() == "phone\n"
@@ -0,0 +1,99 @@
+import importlib
+import importlib.util
+import sys
+import types
+
+import pytest
+
+
+def fake_module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+
+@pytest.fixture
+def c2f(monkeypatch):
+    # 只测试纯函数，OpenTAD、共享内存 DataLoader（以及未安装时的 torch）由测试替身代替
+    modules = [
+        fake_module("opentad"),
+        fake_module("opentad.cores"),
+        fake_module("opentad.cores.test_engine", eval_one_epoch=None),
+        fake_module("opentad.datasets"),
+        fake_module("opentad.datasets.builder", build_dataset=None),
+        fake_module("opentad.evaluations", build_evaluator=None),
+        fake_module("opentad.models", build_detector=None),
+        fake_module("opentad.utils"),
+        fake_module("opentad.utils.logger", setup_logger=None),
+        fake_module("shared_memory_loader", build_dataloader=None),
+    ]
+    if importlib.util.find_spec("torch") is None:
+        modules += [
+            fake_module("torch"),
+            fake_module("torch.distributed"),
+            fake_module("torch.nn"),
+            fake_module("torch.nn.parallel", DistributedDataParallel=None),
+        ]
+    for module in modules:
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+    monkeypatch.delitem(sys.modules, "coarse_to_fine_inference", raising=False)
+    module = importlib.import_module("coarse_to_fine_inference")
+    yield module
+    sys.modules.pop("coarse_to_fine_inference", None)
+
+
+def det(start, end, score):
+    return dict(segment=[start, end], score=score, label="phone")
+
+
+def test_window_range(c2f):
+    # 100 帧 10 秒，窗口中心 20..59 帧
+    data_item = ["video", dict(duration=10.0, frame=100), [], list(range(20, 60))]
+    assert c2f.window_range(data_item) == pytest.approx((2.0, 5.9))
+
+
+def test_overlaps_and_in_regions(c2f):
+    regions = [[10.0, 20.0], [30.0, 40.0]]
+    assert c2f.overlaps([5.0, 10.0], regions)
+    assert c2f.overlaps([18.0, 32.0], regions)
+    assert not c2f.overlaps([21.0, 29.0], regions)
+    assert not c2f.overlaps([0.0, 100.0], [])
+
+    # 中心 12 在区域内，中心 22 不在，尽管两者都与区域重叠
+    assert c2f.in_regions([5.0, 19.0], regions)
+    assert not c2f.in_regions([15.0, 29.0], regions)
+    assert not c2f.in_regions([15.0, 20.0], [])
+
+
+def test_find_candidate_regions_merges_with_margin(c2f):
+    results = {
+        "a": [det(3.0, 4.0, 0.9), det(10.0, 12.0, 0.5), det(30.0, 31.0, 0.8), det(50.0, 51.0, 0.05)],
+        "b": [det(1.0, 2.0, 0.01)],
+    }
+    regions = c2f.find_candidate_regions(results, score_thresh=0.1, margin_secs=5.0)
+    # [0,9] 与 [5,17] 合并；低于阈值的检测不产生区域；起点不小于 0
+    assert regions == {"a": [[0.0, 17.0], [25.0, 36.0]], "b": []}
+
+
+def test_merge_detections_splits_by_center(c2f):
+    regions = {"a": [[10.0, 20.0]]}
+    coarse = {"a": [det(12.0, 14.0, 0.6), det(40.0, 42.0, 0.7)]}
+    fine = {"a": [det(12.5, 14.5, 0.9), det(18.0, 26.0, 0.8)]}
+    merged = c2f.merge_detections(coarse, fine, regions)
+    # 区域内用细检测，区域外用粗检测；中心 22 的细检测和区域内的粗检测都被丢弃
+    assert merged == {"a": [det(12.5, 14.5, 0.9), det(40.0, 42.0, 0.7)]}
+
+
+def test_merge_detections_without_regions_keeps_coarse(c2f):
+    coarse = {"a": [det(1.0, 2.0, 0.3)], "b": [det(5.0, 6.0, 0.2)]}
+    fine = {"a": [det(1.0, 2.0, 0.9)]}
+    merged = c2f.merge_detections(coarse, fine, {"a": [], "b": []})
+    assert merged == {"a": [det(1.0, 2.0, 0.3)], "b": [det(5.0, 6.0, 0.2)]}
+
+
+def test_merge_detections_caps_max_seg_num(c2f):
+    regions = {"a": [[0.0, 10.0]]}
+    coarse = {"a": [det(20.0 + i, 21.0 + i, 0.1 * i) for i in range(5)]}
+    fine = {"a": [det(1.0, 2.0, 0.95), det(3.0, 4.0, 0.05)]}
+    merged = c2f.merge_detections(coarse, fine, regions, max_seg_num=3)
+    assert [d["score"] for d in merged["a"]] == pytest.approx([0.95, 0.4, 0.3])
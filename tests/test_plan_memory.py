@@ -0,0 +1,137 @@
+import pytest
+
+pytest.importorskip("mmengine")
+
+from mmengine.config import Config  # noqa: E402
+
+from plan_memory import (  # noqa: E402
+    GB,
+    AnalyticProfile,
+    MemoryPlanner,
+    fit_quadratic,
+    get_input_size,
+    head_num_params,
+    num_tokens,
+)
+
+BACKBONE_CFG = dict(embed_dims=384, depth=12, num_heads=6, patch_size=16, num_frames=16)
+
+PIPELINE = [
+    dict(type="PrepareVideoInfo", format="mp4"),
+    dict(type="mmaction.Resize", scale=(-1, 240)),
+    dict(type="mmaction.RandomResizedCrop", area_range=(0.95, 1.0)),
+    dict(type="mmaction.Resize", scale=(224, 224), keep_ratio=False),
+    dict(type="mmaction.FormatShape", input_format="NCTHW"),
+]
+
+
+class FakeProfile:
+    num_params = 1000
+    num_trainable_params = 100
+    depth = 4
+    dims = 8
+
+    def activation_bytes(self, n):
+        return 1000.0 * n
+
+    def flops(self, n):
+        return 10.0 * n
+
+
+def make_cfg(with_cp=False, amp=False, ema=False, adapter_only=False):
+    optimizer = dict(type="AdamW", lr=1e-4)
+    if adapter_only:
+        optimizer["backbone"] = dict(lr=0, exclude=["backbone"])
+    return Config(
+        dict(
+            scale_factor=1,
+            model=dict(
+                backbone=dict(backbone=dict(BACKBONE_CFG, with_cp=with_cp)),
+                projection=dict(in_channels=384),
+                rpn_head=dict(num_classes=7),
+            ),
+            dataset=dict(train=dict(pipeline=PIPELINE)),
+            solver=dict(amp=amp, ema=ema),
+            optimizer=optimizer,
+        )
+    )
+
+
+def test_get_input_size():
+    assert get_input_size(PIPELINE) == (224, 224)
+    assert get_input_size(PIPELINE + [dict(type="mmaction.CenterCrop", crop_size=160)]) == (160, 160)
+    with pytest.raises(AssertionError):
+        get_input_size(PIPELINE[:3])
+
+
+def test_num_tokens():
+    assert num_tokens(BACKBONE_CFG, (224, 224)) == 8 * 14 * 14
+    assert num_tokens(BACKBONE_CFG, (160, 160)) == 8 * 10 * 10
+
+
+def test_fit_quadratic_recovers_analytic_profile():
+    profile = AnalyticProfile(BACKBONE_CFG)
+    # ViT-S/16 约 22M 参数
+    assert profile.num_params == pytest.approx(22e6, rel=0.05)
+    activation_bytes = fit_quadratic([(n, profile.activation_bytes(n)) for n in (400, 600)])
+    assert activation_bytes(1568) == pytest.approx(profile.activation_bytes(1568))
+    flops = fit_quadratic([(n, profile.flops(n)) for n in (400, 600)])
+    assert flops(1568) == pytest.approx(profile.flops(1568))
+
+
+def test_head_num_params():
+    # ActionFormer 在 2048 维 I3D 特征上约 29M 参数
+    assert head_num_params(dict()) == pytest.approx(29e6, rel=0.05)
+    assert head_num_params(dict(projection=dict(in_channels=2048))) - head_num_params(
+        dict(projection=dict(in_channels=384))
+    ) == 3 * (2048 - 384) * 512
+
+
+def test_param_bytes():
+    profile = FakeProfile()
+    planner = MemoryPlanner(make_cfg(), profile)
+    head = planner.num_head_params
+    assert head == head_num_params(make_cfg().model)
+    # 参数 + 梯度 + AdamW 两个状态
+    assert planner.param_bytes() == 16 * (1000 + head)
+    assert MemoryPlanner(make_cfg(ema=True), profile).param_bytes() == 20 * (1000 + head)
+    # 只训练 adapter 时，冻结的 backbone 只有参数，检测头仍然参与训练
+    planner = MemoryPlanner(make_cfg(adapter_only=True), profile)
+    assert planner.adapter_only
+    assert planner.param_bytes() == 4 * (1000 + head) + 12 * (100 + head)
+
+
+def test_activation_bytes():
+    profile = FakeProfile()
+    tokens = 8 * 14 * 14
+    chunk_bytes = profile.activation_bytes(tokens)
+    planner = MemoryPlanner(make_cfg(), profile)
+    # 768 帧 = 48 个 chunk
+    assert planner.activation_bytes(768, 2) == 2 * 48 * chunk_bytes
+
+    cp_chunk_bytes = 4 * profile.depth * tokens * profile.dims + chunk_bytes / profile.depth
+    planner = MemoryPlanner(make_cfg(with_cp=True), profile)
+    assert planner.activation_bytes(768, 1) == pytest.approx(48 * cp_chunk_bytes)
+    planner = MemoryPlanner(make_cfg(with_cp=True, amp=True), profile)
+    assert planner.activation_bytes(768, 1) == pytest.approx(48 * cp_chunk_bytes / 2)
+
+
+def test_input_bytes():
+    planner = MemoryPlanner(make_cfg(), FakeProfile())
+    # 768x3x224x224 的 fp32 输入约 0.46 GB，另有一份 uint8
+    fp32_bytes = 768 * 3 * 224 * 224 * 4
+    assert fp32_bytes == pytest.approx(0.46e9, rel=0.01)
+    assert planner.input_bytes(768, 2) == 2 * fp32_bytes * 5 // 4
+
+
+def test_recommend():
+    planner = MemoryPlanner(make_cfg(), FakeProfile(), reserve_gb=0)
+    window_sizes = [256, 512, 768]
+
+    budget = (planner.gpu_bytes(768, 2) + planner.gpu_bytes(768, 3)) / 2 / GB
+    assert planner.recommend(window_sizes, budget) == (768, 2)
+    # 最大窗口放不下一个样本时退到更小的窗口
+    budget = (planner.gpu_bytes(512, 1) + planner.gpu_bytes(768, 1)) / 2 / GB
+    assert planner.recommend(window_sizes, budget, max_batch_size=1) == (512, 1)
+    assert planner.recommend(window_sizes, planner.gpu_bytes(256, 1) / 2 / GB) is None
+    assert planner.recommend(window_sizes, 1000, max_batch_size=4) == (768, 4)
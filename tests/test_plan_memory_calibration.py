@@ -0,0 +1,60 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("mmengine")
+
+from torch import nn  # noqa: E402
+
+from plan_memory import fit_quadratic, measure_activation_bytes, num_tokens  # noqa: E402
+
+BACKBONE_CFG = dict(embed_dims=64, num_heads=4, patch_size=16, num_frames=16)
+
+
+class ToyBlock(nn.Module):
+    def __init__(self, dims, num_heads):
+        super().__init__()
+        self.num_heads = num_heads
+        self.norm1 = nn.LayerNorm(dims)
+        self.qkv = nn.Linear(dims, 3 * dims)
+        self.proj = nn.Linear(dims, dims)
+        self.norm2 = nn.LayerNorm(dims)
+        self.mlp = nn.Sequential(nn.Linear(dims, 4 * dims), nn.GELU(), nn.Linear(4 * dims, dims))
+
+    def forward(self, x):
+        b, n, c = x.shape
+        q, k, v = self.qkv(self.norm1(x)).reshape(b, n, 3, self.num_heads, -1).permute(2, 0, 3, 1, 4)
+        attn = (q @ k.transpose(-2, -1)).softmax(dim=-1)
+        x = x + self.proj((attn @ v).transpose(1, 2).reshape(b, n, c))
+        return x + self.mlp(self.norm2(x))
+
+
+class ToyViT(nn.Module):
+    def __init__(self, dims=64, num_heads=4, depth=2):
+        super().__init__()
+        self.patch_embed = nn.Conv3d(3, dims, kernel_size=(2, 16, 16), stride=(2, 16, 16))
+        self.blocks = nn.Sequential(*[ToyBlock(dims, num_heads) for _ in range(depth)])
+
+    def forward(self, x):
+        return self.blocks(self.patch_embed(x).flatten(2).transpose(1, 2))
+
+
+def measure(model, size):
+    inputs = torch.randn(1, 3, BACKBONE_CFG["num_frames"], size, size)
+    return num_tokens(BACKBONE_CFG, (size, size)), measure_activation_bytes(model, inputs)
+
+
+def test_measure_activation_bytes_excludes_parameters():
+    model = ToyViT()
+    param_bytes = sum(param.numel() * param.element_size() for param in model.parameters())
+    _, activation_bytes = measure(model, 32)
+    assert 0 < activation_bytes < param_bytes
+
+
+def test_extrapolated_activation_bytes_match_measurement():
+    torch.manual_seed(0)
+    model = ToyViT()
+    activation_bytes = fit_quadratic([measure(model, 32), measure(model, 48)])
+    n, measured = measure(model, 96)
+    estimated = activation_bytes(n)
+    assert estimated > 0
+    assert estimated == pytest.approx(measured, rel=0.05)
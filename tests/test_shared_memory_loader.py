@@ -0,0 +1,139 @@
+import importlib
+import sys
+import threading
+import types
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+INPUT_SHAPE = (1, 3, 4, 8, 8)
+
+
+def fake_collate(batch):
+    return {key: [sample[key] for sample in batch] for key in batch[0]}
+
+
+def fake_build_dataloader(*args, **kwargs):
+    return "opentad", args, kwargs
+
+
+class FixedShapeDataset(torch.utils.data.Dataset):
+    def __init__(self, length=7):
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return dict(
+            inputs=torch.full(INPUT_SHAPE, index, dtype=torch.uint8),
+            masks=torch.ones(4, dtype=torch.bool),
+            metas=dict(index=index),
+        )
+
+
+@pytest.fixture
+def shm(monkeypatch):
+    # OpenTAD 的 collate / build_dataloader 由测试替身代替
+    builder = types.ModuleType("opentad.datasets.builder")
+    builder.collate = fake_collate
+    builder.build_dataloader = fake_build_dataloader
+    monkeypatch.setitem(sys.modules, "opentad", types.ModuleType("opentad"))
+    monkeypatch.setitem(sys.modules, "opentad.datasets", types.ModuleType("opentad.datasets"))
+    monkeypatch.setitem(sys.modules, "opentad.datasets.builder", builder)
+    monkeypatch.delitem(sys.modules, "shared_memory_loader", raising=False)
+    module = importlib.import_module("shared_memory_loader")
+    yield module
+    sys.modules.pop("shared_memory_loader", None)
+
+
+def run_with_timeout(fn, timeout=60):
+    """在线程中运行 fn，超时说明槽位死锁"""
+    result = {}
+
+    def target():
+        try:
+            result["value"] = fn()
+        except BaseException as e:  # noqa: B036
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "shared memory loader deadlocked"
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def build_loader(shm, **kwargs):
+    return shm.build_dataloader(
+        FixedShapeDataset(),
+        batch_size=2,
+        rank=0,
+        world_size=1,
+        shuffle=False,
+        drop_last=False,
+        shared_memory=True,
+        num_workers=2,
+        **kwargs,
+    )
+
+
+def collect_epoch(loader):
+    pool = loader.pool
+    batches = []
+    for batch in loader:
+        inputs = batch["inputs"]
+        # inputs 是缓冲池某个槽位的视图，而不是新分配的张量
+        assert inputs.is_shared()
+        assert inputs.untyped_storage().nbytes() == pool.buffers.untyped_storage().nbytes()
+        assert inputs.storage_offset() % pool.slot_numel == 0
+        batches.append(
+            (
+                inputs[:, 0, 0, 0, 0, 0].tolist(),
+                [meta["index"] for meta in batch["metas"]],
+            )
+        )
+    return batches
+
+
+EXPECTED_EPOCH = [([0, 1], [0, 1]), ([2, 3], [2, 3]), ([4, 5], [4, 5]), ([6], [6])]
+
+
+def test_slots_are_recycled_across_epochs(shm):
+    loader = build_loader(shm)
+    assert loader.pool.num_buffers == 2 * 2 + 1
+
+    for epoch in range(2):
+        loader.sampler.set_epoch(epoch)
+        assert run_with_timeout(lambda: collect_epoch(loader)) == EXPECTED_EPOCH
+
+
+def test_partial_last_batch(shm):
+    loader = build_loader(shm)
+    shapes = run_with_timeout(lambda: [tuple(batch["inputs"].shape) for batch in loader])
+    assert shapes == [(2, *INPUT_SHAPE)] * 3 + [(1, *INPUT_SHAPE)]
+
+
+def test_interrupted_epoch_does_not_leak_slots(shm):
+    loader = build_loader(shm)
+
+    def interrupted():
+        for _ in loader:
+            break
+
+    run_with_timeout(interrupted)
+    assert run_with_timeout(lambda: collect_epoch(loader)) == EXPECTED_EPOCH
+
+
+def test_persistent_workers_rejected(shm):
+    with pytest.raises(AssertionError):
+        build_loader(shm, persistent_workers=True)
+
+
+def test_disabled_falls_back_to_opentad_builder(shm):
+    result = shm.build_dataloader(FixedShapeDataset(), 2, 0, 1, num_workers=1)
+    assert result[0] == "opentad"
+    assert "shared_memory" not in result[2]
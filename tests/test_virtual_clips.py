@@ -0,0 +1,112 @@
+import importlib
+import json
+import sys
+import types
+
+import numpy as np
+import pytest
+
+
+class FakeRegistry:
+    def register_module(self, force=False):
+        return lambda cls: cls
+
+
+class FakePrepareVideoInfo:
+    def __init__(self, format="mp4"):
+        self.format = format
+
+    def __call__(self, results):
+        results["filename"] = f"{results['data_path']}/{results['video_name']}.{self.format}"
+        return results
+
+
+class FakeLoadFrames:
+    """模拟 OpenTAD 的 LoadFrames：采样 trunc_len 帧，超出部分 clip 到 total_frames - 1"""
+
+    def __init__(self, trunc_len=8):
+        self.trunc_len = trunc_len
+        self.seen_total_frames = None
+
+    def __call__(self, results):
+        self.seen_total_frames = results["total_frames"]
+        frame_inds = np.arange(self.trunc_len)
+        results["frame_inds"] = np.clip(frame_inds, 0, results["total_frames"] - 1)
+        return results
+
+
+@pytest.fixture
+def virtual_clips(monkeypatch):
+    # OpenTAD 的父类由测试替身代替，只测试帧范围的解析和平移
+    builder = types.ModuleType("opentad.datasets.builder")
+    builder.PIPELINES = FakeRegistry()
+    loading = types.ModuleType("opentad.datasets.transforms.loading")
+    loading.PrepareVideoInfo = FakePrepareVideoInfo
+    loading.LoadFrames = FakeLoadFrames
+    for name in ["opentad", "opentad.datasets", "opentad.datasets.transforms"]:
+        monkeypatch.setitem(sys.modules, name, types.ModuleType(name))
+    monkeypatch.setitem(sys.modules, "opentad.datasets.builder", builder)
+    monkeypatch.setitem(sys.modules, "opentad.datasets.transforms.loading", loading)
+    monkeypatch.delitem(sys.modules, "virtual_clips", raising=False)
+    module = importlib.import_module("virtual_clips")
+    yield module
+    sys.modules.pop("virtual_clips", None)
+
+
+@pytest.fixture
+def manifest_path(tmp_path):
+    database = {
+        "clip_a_100_105": {
+            "duration": 0.2,
+            "frame": 5,
+            "subset": "training",
+            "annotations": [],
+            "source_video": "/videos/a.mp4",
+            "start_frame": 100,
+            "end_frame": 105,
+        },
+        "plain_clip": {"duration": 1.0, "frame": 25, "subset": "training", "annotations": []},
+    }
+    path = tmp_path / "annotations.json"
+    path.write_text(json.dumps({"database": database}))
+    return str(path)
+
+
+def test_load_manifest_only_keeps_virtual_clips(virtual_clips, manifest_path):
+    manifest = virtual_clips.load_manifest(manifest_path)
+    assert manifest == {"clip_a_100_105": ("/videos/a.mp4", 100, 105)}
+
+
+def test_prepare_video_info_resolves_source_video(virtual_clips, manifest_path):
+    prepare = virtual_clips.PrepareVideoInfo(manifest=manifest_path, format="mp4")
+
+    results = prepare(dict(video_name="clip_a_100_105", data_path="clips"))
+    assert results["filename"] == "/videos/a.mp4"
+    assert (results["clip_start_frame"], results["clip_end_frame"]) == (100, 105)
+
+    results = prepare(dict(video_name="plain_clip", data_path="clips"))
+    assert results["filename"] == "clips/plain_clip.mp4"
+    assert "clip_start_frame" not in results
+
+
+def test_load_frames_shifts_and_clips_to_clip_range(virtual_clips):
+    load_frames = virtual_clips.LoadFrames(trunc_len=8)
+    results = load_frames(dict(total_frames=1000, clip_start_frame=100, clip_end_frame=105))
+
+    assert load_frames.seen_total_frames == 5
+    np.testing.assert_array_equal(results["frame_inds"], [100, 101, 102, 103, 104, 104, 104, 104])
+    assert results["total_frames"] == 1000
+
+
+def test_load_frames_clip_end_beyond_source(virtual_clips):
+    load_frames = virtual_clips.LoadFrames(trunc_len=8)
+    results = load_frames(dict(total_frames=103, clip_start_frame=100, clip_end_frame=105))
+
+    assert load_frames.seen_total_frames == 3
+    assert results["frame_inds"].max() == 102
+
+
+def test_load_frames_without_clip_range_is_unchanged(virtual_clips):
+    load_frames = virtual_clips.LoadFrames(trunc_len=4)
+    results = load_frames(dict(total_frames=3))
+    np.testing.assert_array_equal(results["frame_inds"], [0, 1, 2, 2])
@@ -0,0 +1,80 @@
+"""
+虚拟片段（virtual clips）加载支持
+
+`split_videos.py --virtual` 不再用 FFmpeg 切出 mp4，而是在标注条目中记录
+源视频路径和帧范围（source_video / start_frame / end_frame）。这里覆盖 OpenTAD 的
+PrepareVideoInfo 和 LoadFrames，使加载流程直接从原始视频中按帧范围解码。
+
+在配置文件中引入本模块，并把合并后的标注文件作为 manifest 传给 PrepareVideoInfo：
+
+    custom_imports = dict(imports=["virtual_clips"], allow_failed_imports=False)
+    ...
+    dict(type="PrepareVideoInfo", format="mp4", manifest=annotation_path),
+
+不在 manifest 中的视频按原有方式从 data_path 加载，数据集定义无需改动。
+"""
+import json
+
+from opentad.datasets.builder import PIPELINES
+from opentad.datasets.transforms.loading import LoadFrames as _LoadFrames
+from opentad.datasets.transforms.loading import PrepareVideoInfo as _PrepareVideoInfo
+
+
+def load_manifest(manifest_path):
+    """
+    从标注文件中读取虚拟片段的帧范围
+
+    Args:
+        manifest_path (str): 标注 JSON 文件路径，格式同 merge_annos.py 的输出
+
+    Returns:
+        dict: 片段名 -> (源视频路径, 起始帧, 结束帧)
+    """
+    with open(manifest_path, "r") as f:
+        database = json.load(f)["database"]
+
+    manifest = {}
+    for clip_name, clip_info in database.items():
+        if "source_video" not in clip_info:
+            continue
+        manifest[clip_name] = (clip_info["source_video"], int(clip_info["start_frame"]), int(clip_info["end_frame"]))
+    return manifest
+
+
+@PIPELINES.register_module(force=True)
+class PrepareVideoInfo(_PrepareVideoInfo):
+    """在原有 PrepareVideoInfo 基础上，把虚拟片段解析到源视频和帧范围"""
+
+    def __init__(self, manifest=None, **kwargs):
+        super().__init__(**kwargs)
+        self.manifest = load_manifest(manifest) if manifest is not None else {}
+
+    def __call__(self, results):
+        results = super().__call__(results)
+        if results["video_name"] in self.manifest:
+            source_video, start_frame, end_frame = self.manifest[results["video_name"]]
+            results["filename"] = source_video
+            results["clip_start_frame"] = start_frame
+            results["clip_end_frame"] = end_frame
+        return results
+
+
+@PIPELINES.register_module(force=True)
+class LoadFrames(_LoadFrames):
+    """对虚拟片段，在片段内部采样帧，再把帧索引平移到源视频上"""
+
+    def __call__(self, results):
+        if "clip_start_frame" not in results:
+            return super().__call__(results)
+
+        start_frame = results["clip_start_frame"]
+        end_frame = results["clip_end_frame"]
+        # DecordInit 给出的是整段源视频的帧数，这里换成片段长度，保证采样和 padding 逻辑与切好的 mp4 一致
+        source_total_frames = results["total_frames"]
+        results["total_frames"] = min(end_frame, source_total_frames) - start_frame
+
+        results = super().__call__(results)
+
+        results["frame_inds"] = results["frame_inds"] + start_frame
+        results["total_frames"] = source_total_frames
+        return results